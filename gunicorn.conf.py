@@ -8,7 +8,8 @@ backlog = 2048
 
 # Worker processes
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "uvicorn.workers.UvicornWorker"
+# Worker con uvloop + httptools (vedi src/core/gunicorn_worker.py)
+worker_class = "src.core.gunicorn_worker.UvloopUvicornWorker"
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 50
@@ -1,6 +1,8 @@
 """API dependencies."""
 
-from fastapi import Depends
+from typing import Annotated
+
+from fastapi import Depends, Request
 
 from src.services.document_service import DocumentService
 from src.services.rag_service import RAGService, rag_service_singleton
@@ -10,17 +12,16 @@ from src.services.rag_service import RAGService, rag_service_singleton
 document_service_singleton = DocumentService(rag_service_singleton)
 
 
-async def get_rag_service() -> RAGService:
-    """Get singleton RAG service instance."""
-    await rag_service_singleton.initialize()
-    return rag_service_singleton
+def get_rag_service(request: Request) -> RAGService:
+    """Get the lifespan-managed RAG service instance."""
+    return request.app.state.rag_service
 
 
-async def get_document_service() -> DocumentService:
-    """Get singleton Document service instance."""
-    return document_service_singleton
+def get_document_service(request: Request) -> DocumentService:
+    """Get the lifespan-managed Document service instance."""
+    return request.app.state.document_service
 
 
 # Type aliases for dependency injection
-RAGServiceDep = Depends(get_rag_service)
-DocumentServiceDep = Depends(get_document_service)
+RAGServiceDep = Annotated[RAGService, Depends(get_rag_service)]
+DocumentServiceDep = Annotated[DocumentService, Depends(get_document_service)]
@@ -1,11 +1,13 @@
 """Document endpoints."""
 
+import hashlib
+import os
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Optional
-from uuid import UUID
 
 from fastapi import (
     APIRouter,
-    Depends,
     File,
     Form,
     HTTPException,
@@ -14,37 +16,99 @@ from fastapi import (
     UploadFile,
     status,
 )
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, ORJSONResponse
+from jinja2 import Environment
 
-from src.api.dependencies import DocumentServiceDep, get_document_service
+from src.api.dependencies import DocumentServiceDep
+from src.core.config import settings
 from src.models.document import Document, DocumentCreate, DocumentList, DocumentUpdate
-from src.services.document_service import DocumentService
-from src.services.rag_service import rag_service_singleton
+from src.services.document_service import UploadTooLargeError
 from src.utils.logging import get_logger
 
 logger = get_logger(__name__)
 
 router = APIRouter()
 
+# Cache di frammenti HTML già renderizzati, limitata per non crescere all'infinito
+_HTML_CACHE_MAX = 32
+_html_cache: "OrderedDict[str, str]" = OrderedDict()
+
+# Frammenti HTMX precompilati a import time: niente parsing/formattazione per richiesta
+_EMPTY_LIST_HTML = (
+    '<div class="text-center py-8 text-gray-500"><svg class="mx-auto h-12 w-12 text-gray-400" stroke="currentColor"'
+    ' fill="none" viewBox="0 0 48 48"><path d="M28 8H12a4 4 0 00-4 4v20m32-12v8m0 0v8a4 4 0 01-4 4H12a4 4 0'
+    " 01-4-4v-4m32-4l-3.172-3.172a4 4 0 00-5.656 0L28 28M8 32l9.172-9.172a4 4 0 015.656 0L28 28m0 0l4 4m4-24h8m-4-4v8"
+    'm-12 4h.02" stroke-width="2" stroke-linecap="round" stroke-linejoin="round" /></svg>'
+    '<p class="mt-2 text-sm">Nessun documento caricato</p><p class="text-xs">Carica un PDF per iniziare</p></div>'
+)
+
+# Autoescape attivo: i filename arrivano dall'utente e non devono finire
+# nell'HTML senza escaping
+_jinja_env = Environment(autoescape=True)
+_LIST_TMPL = _jinja_env.from_string(
+    '<ul class="divide-y divide-gray-200">'
+    "{% for doc in docs %}"
+    '<li class="py-2 flex items-center justify-between"><span class="font-medium">{{ doc.filename }}</span>'
+    '<span class="text-xs text-gray-500">{{ doc.file_size//1024 }} KB</span></li>'
+    "{% endfor %}"
+    "</ul>"
+)
+_UPLOAD_OK_TMPL = _jinja_env.from_string(
+    '<div class="text-green-700">Documento <b>{{ filename }}</b> caricato con successo!</div>'
+)
+
+
+@lru_cache(maxsize=256)
+def _stat_for(path: str) -> os.stat_result:
+    """Stat a document file once; uploaded temp files are immutable."""
+    return os.stat(path)
+
+
+def _documents_etag(documents: list) -> str:
+    """Content hash over the fields rendered in the HTMX document list."""
+    hasher = hashlib.blake2b(digest_size=8)
+    for doc in documents:
+        hasher.update(f"{doc.id}:{doc.filename}:{doc.file_size}".encode())
+    return hasher.hexdigest()
+
+
+def _render_document_list(documents: list) -> str:
+    """Render the HTMX document list fragment."""
+    if not documents:
+        return _EMPTY_LIST_HTML
+    return _LIST_TMPL.render(docs=documents)
+
 
 @router.post("/", response_model=Document, status_code=status.HTTP_201_CREATED)
 async def upload_document(
+    document_service: DocumentServiceDep,
     file: UploadFile = File(...),
     title: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
     tags: Optional[str] = Form(None),
-    document_service: DocumentService = Depends(get_document_service),
     request: Request = None,
 ) -> Response:
     """Upload a new document."""
+    # Fast path: rifiuto le estensioni non supportate prima di toccare il
+    # body della richiesta o il document service
+    extension = os.path.splitext(file.filename or "")[1].lower()
+    if extension not in settings.security.allowed_extensions_set:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported file type: {extension or 'unknown'}",
+        )
+
     try:
         # Parse tags
         tag_list = []
         if tags:
             tag_list = [tag.strip() for tag in tags.split(",") if tag.strip()]
 
-        # Create metadata
-        metadata = DocumentCreate(filename=file.filename, title=title, description=description, tags=tag_list)
+        # Create metadata; i campi arrivano da Form già validate, quindi
+        # model_construct salta la rivalidazione Pydantic
+        metadata = DocumentCreate.model_construct(
+            filename=file.filename, title=title, description=description, tags=tag_list
+        )
 
         # Upload document
         document = await document_service.upload_document(file, metadata)
@@ -52,12 +116,12 @@ async def upload_document(
 
         # Se la richiesta è HTMX, restituisco HTML user-friendly
         if request and request.headers.get("HX-Request") == "true":
-            return HTMLResponse(
-                f'<div class="text-green-700">Documento <b>{document.filename}</b> caricato con successo!</div>'
-            )
+            return HTMLResponse(_UPLOAD_OK_TMPL.render(filename=document.filename))
         # Altrimenti JSON
-        return JSONResponse(document.model_dump())
+        return ORJSONResponse(document.model_dump(mode="json"))
 
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
@@ -69,9 +133,7 @@ async def upload_document(
 
 
 @router.post("/reset")
-async def reset_documents(
-    document_service: DocumentService = Depends(get_document_service),
-):
+async def reset_documents(document_service: DocumentServiceDep):
     """Delete all documents from memory and reset the index."""
     # STATELESS: uso il nuovo metodo che pulisce solo la memoria
     deleted_count = document_service.reset_documents()
@@ -80,28 +142,33 @@ async def reset_documents(
 
 @router.get("/", response_model=DocumentList)
 async def list_documents(
+    document_service: DocumentServiceDep,
     skip: int = 0,
     limit: int = 10,
     search: Optional[str] = None,
-    document_service: DocumentService = Depends(get_document_service),
     request: Request = None,
 ) -> Response:
     """List all documents."""
     try:
-        doc_list = await document_service.get_documents(skip=skip, limit=limit, search=search)
-        # Se la richiesta è HTMX, restituisco HTML user-friendly
+        # Se la richiesta è HTMX, restituisco HTML user-friendly partendo
+        # dalla proiezione slim: niente DocumentList/Document Pydantic
         if request and request.headers.get("HX-Request") == "true":
-            if not doc_list.documents:
-                return HTMLResponse(
-                    '<div class="text-center py-8 text-gray-500"><svg class="mx-auto h-12 w-12 text-gray-400" stroke="currentColor" fill="none" viewBox="0 0 48 48"><path d="M28 8H12a4 4 0 00-4 4v20m32-12v8m0 0v8a4 4 0 01-4 4H12a4 4 0 01-4-4v-4m32-4l-3.172-3.172a4 4 0 00-5.656 0L28 28M8 32l9.172-9.172a4 4 0 015.656 0L28 28m0 0l4 4m4-24h8m-4-4v8m-12 4h.02" stroke-width="2" stroke-linecap="round" stroke-linejoin="round" /></svg><p class="mt-2 text-sm">Nessun documento caricato</p><p class="text-xs">Carica un PDF per iniziare</p></div>'
-                )
-            html = '<ul class="divide-y divide-gray-200">'
-            for doc in doc_list.documents:
-                html += f'<li class="py-2 flex items-center justify-between"><span class="font-medium">{doc.filename}</span><span class="text-xs text-gray-500">{doc.file_size//1024} KB</span></li>'
-            html += "</ul>"
-            return HTMLResponse(html)
+            rows = await document_service.get_documents_lite(skip=skip, limit=limit, search=search)
+            etag = _documents_etag(rows)
+            # Lista invariata: rispondo 304 senza rirenderizzare nulla
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+            html = _html_cache.get(etag)
+            if html is None:
+                html = _render_document_list(rows)
+                _html_cache[etag] = html
+                while len(_html_cache) > _HTML_CACHE_MAX:
+                    _html_cache.popitem(last=False)
+            return HTMLResponse(html, headers={"ETag": etag})
         # Altrimenti JSON
-        return JSONResponse(doc_list.model_dump())
+        doc_list = await document_service.get_documents(skip=skip, limit=limit, search=search)
+        return ORJSONResponse(doc_list.model_dump(mode="json"))
     except Exception as e:
         logger.error(f"Failed to list documents: {e}")
         raise HTTPException(
@@ -111,9 +178,7 @@ async def list_documents(
 
 
 @router.get("/{document_id}", response_model=Document)
-async def get_document(
-    document_id: UUID, document_service: DocumentService = Depends(get_document_service)
-) -> Document:
+async def get_document(document_id: str, document_service: DocumentServiceDep) -> Document:
     """Get a specific document."""
     document = await document_service.get_document(document_id)
     if not document:
@@ -122,21 +187,47 @@ async def get_document(
 
 
 @router.get("/{document_id}/download")
-async def download_document(document_id: UUID, document_service: DocumentService = Depends(get_document_service)):
+async def download_document(
+    document_id: str,
+    document_service: DocumentServiceDep,
+    request: Request = None,
+):
     """Download a document file."""
     document = await document_service.get_document(document_id)
     if not document:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
 
     file_path = document.file_path
-    return FileResponse(path=file_path, filename=document.filename, media_type=document.mime_type)
+    try:
+        # I file temporanei non cambiano mai dopo l'upload, quindi lo stat
+        # può essere cachato per path
+        stat_result = _stat_for(file_path)
+    except OSError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document file not found")
+
+    etag = f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=3600",
+        "Accept-Ranges": "bytes",
+    }
+    if request and request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return FileResponse(
+        path=file_path,
+        filename=document.filename,
+        media_type=document.mime_type,
+        stat_result=stat_result,
+        headers=headers,
+    )
 
 
 @router.put("/{document_id}", response_model=Document)
 async def update_document(
-    document_id: UUID,
+    document_id: str,
     update: DocumentUpdate,
-    document_service: DocumentService = Depends(get_document_service),
+    document_service: DocumentServiceDep,
 ) -> Document:
     """Update document metadata."""
     document = await document_service.update_document(document_id, update)
@@ -148,7 +239,7 @@ async def update_document(
 
 
 @router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_document(document_id: UUID, document_service: DocumentService = Depends(get_document_service)):
+async def delete_document(document_id: str, document_service: DocumentServiceDep):
     """Delete a document."""
     success = await document_service.delete_document(document_id)
     if not success:
@@ -158,9 +249,7 @@ async def delete_document(document_id: UUID, document_service: DocumentService =
 
 
 @router.get("/stats/summary")
-async def get_document_stats(
-    document_service: DocumentService = Depends(get_document_service),
-):
+async def get_document_stats(document_service: DocumentServiceDep):
     """Get document statistics."""
     try:
         return await document_service.get_document_stats()
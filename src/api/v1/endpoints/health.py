@@ -1,31 +1,42 @@
 """Health check endpoints."""
 
+import asyncio
+import time
 from datetime import datetime
 from typing import Any, Dict
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter
 
-from src.api.dependencies import (
-    DocumentServiceDep,
-    get_document_service,
-    get_rag_service,
-)
+from src.api.dependencies import DocumentServiceDep, RAGServiceDep
 from src.core.config import settings
-from src.services.document_service import DocumentService
-from src.services.rag_service import RAGService
 from src.utils.logging import get_logger
 
 logger = get_logger(__name__)
 
 router = APIRouter()
 
+# Timestamp memoizzato a granularità di un secondo: i probe dei load balancer
+# arrivano a raffica e non serve riformattarlo ad ogni chiamata
+_last_ts = 0
+_last_iso = ""
+
+
+def _current_timestamp() -> str:
+    """ISO timestamp, memoized at one-second granularity."""
+    global _last_ts, _last_iso
+    now = int(time.time())
+    if now != _last_ts:
+        _last_ts = now
+        _last_iso = datetime.utcnow().isoformat()
+    return _last_iso
+
 
 @router.get("/")
 async def health_check() -> Dict[str, Any]:
     """Basic health check."""
     return {
         "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": _current_timestamp(),
         "version": settings.app.version,
         "name": settings.app.name,
     }
@@ -33,18 +44,19 @@ async def health_check() -> Dict[str, Any]:
 
 @router.get("/detailed")
 async def detailed_health_check(
-    rag_service: RAGService = Depends(get_rag_service),
-    document_service: DocumentService = Depends(get_document_service),
+    rag_service: RAGServiceDep,
+    document_service: DocumentServiceDep,
 ) -> Dict[str, Any]:
     """Detailed health check with service status."""
     try:
-        # Get service statistics
-        index_stats = await rag_service.get_index_stats()
-        document_stats = await document_service.get_document_stats()
+        # Get service statistics in parallel instead of sequentially
+        index_stats, document_stats = await asyncio.gather(
+            rag_service.get_index_stats(), document_service.get_document_stats()
+        )
 
         return {
             "status": "healthy",
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": _current_timestamp(),
             "version": settings.app.version,
             "name": settings.app.name,
             "services": {
@@ -65,7 +77,7 @@ async def detailed_health_check(
         logger.error(f"Health check failed: {e}")
         return {
             "status": "unhealthy",
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": _current_timestamp(),
             "version": settings.app.version,
             "name": settings.app.name,
             "error": str(e),
@@ -73,19 +85,16 @@ async def detailed_health_check(
 
 
 @router.get("/status")
-async def get_system_status() -> Dict[str, Any]:
+async def get_system_status(document_service: DocumentServiceDep) -> Dict[str, Any]:
     """Get simplified system status."""
     try:
         # Check RAG service status
         rag_status = "ready"  # Assume ready if no error
 
-        # Get document count
+        # Get document count: basta un len() sullo store in memoria, senza
+        # costruire fino a 1000 oggetti Document solo per contarli
         try:
-            from src.api.dependencies import get_document_service
-
-            document_service = await get_document_service()
-            documents = await document_service.get_documents(limit=1000)
-            doc_count = documents.total
+            doc_count = document_service.get_documents_count()
         except Exception as e:
             logger.error(f"Failed to get document count: {e}")
             doc_count = 0
@@ -93,7 +102,7 @@ async def get_system_status() -> Dict[str, Any]:
         return {
             "rag_status": rag_status,
             "documents_count": doc_count,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": _current_timestamp(),
         }
 
     except Exception as e:
@@ -101,6 +110,6 @@ async def get_system_status() -> Dict[str, Any]:
         return {
             "rag_status": "error",
             "documents_count": 0,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": _current_timestamp(),
             "error": str(e),
         }
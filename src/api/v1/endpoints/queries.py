@@ -1,11 +1,10 @@
 """Query endpoints."""
 
-from fastapi import APIRouter, Depends, Form, HTTPException, Request, Response, status
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import APIRouter, Form, HTTPException, Request, Response, status
+from fastapi.responses import HTMLResponse, ORJSONResponse
 
-from src.api.dependencies import get_rag_service
+from src.api.dependencies import RAGServiceDep
 from src.models.query import QueryRequest, QueryResponse
-from src.services.rag_service import RAGService
 from src.utils.logging import get_logger
 
 logger = get_logger(__name__)
@@ -15,22 +14,28 @@ router = APIRouter()
 
 @router.post("/", response_model=QueryResponse)
 async def query_documents(
-    query: str = Form(...),
-    top_k: int = Form(5),
-    similarity_threshold: float = Form(0.7),
-    rag_service: RAGService = Depends(get_rag_service),
+    rag_service: RAGServiceDep,
+    query: str = Form(..., min_length=1, max_length=1000),
+    top_k: int = Form(5, ge=1, le=20),
+    similarity_threshold: float = Form(0.7, ge=0.0, le=1.0),
     request: Request = None,
 ) -> Response:
     """Query documents using RAG."""
     try:
         logger.info(f"Processing query: {query[:100]}...")
-        req = QueryRequest(query=query, top_k=top_k, similarity_threshold=similarity_threshold)
-        response = await rag_service.query(req)
+        # I campi sono già validati dai vincoli sulle Form: model_construct
+        # evita una seconda passata di validazione Pydantic
+        req = QueryRequest.model_construct(query=query, top_k=top_k, similarity_threshold=similarity_threshold)
+        batcher = getattr(request.app.state, "query_batcher", None) if request else None
+        if batcher is not None:
+            response = await batcher.submit(req)
+        else:
+            response = await rag_service.query(req)
         logger.info(f"Query completed in {response.processing_time:.2f}s")
         # Se la richiesta è HTMX, restituisco solo l'answer
         if request and request.headers.get("HX-Request") == "true":
             return HTMLResponse(response.answer)
-        return JSONResponse(response.model_dump())
+        return ORJSONResponse(response.model_dump(mode="json"))
     except Exception as e:
         logger.error(f"Query failed: {e}")
         raise HTTPException(
@@ -40,7 +45,7 @@ async def query_documents(
 
 
 @router.get("/stats/index")
-async def get_index_stats(rag_service: RAGService = Depends(get_rag_service)):
+async def get_index_stats(rag_service: RAGServiceDep):
     """Get RAG index statistics."""
     try:
         return await rag_service.get_index_stats()
@@ -1,6 +1,7 @@
 """Configuration management for Local RAG Assistant."""
 
 import os
+from functools import cached_property, lru_cache
 from pathlib import Path
 from typing import List, Optional
 
@@ -59,6 +60,11 @@ class SecuritySettings(BaseSettings):
     allowed_extensions: List[str] = Field(default=[".pdf"], env="ALLOWED_EXTENSIONS")
     rate_limit: int = Field(default=100, env="RATE_LIMIT")
 
+    @cached_property
+    def allowed_extensions_set(self) -> frozenset:
+        """Allowed extensions as a lowercased frozenset for O(1) membership checks."""
+        return frozenset(ext.lower() for ext in self.allowed_extensions)
+
 
 class RedisSettings(BaseSettings):
     """Redis settings."""
@@ -70,13 +76,15 @@ class RedisSettings(BaseSettings):
 class Settings(BaseSettings):
     """Main settings class."""
 
-    app: AppSettings = AppSettings()
-    server: ServerSettings = ServerSettings()
-    rag: RAGSettings = RAGSettings()
-    llm: LLMSettings = LLMSettings()
-    storage: StorageSettings = StorageSettings()
-    security: SecuritySettings = SecuritySettings()
-    redis: RedisSettings = RedisSettings()
+    # default_factory: le sezioni vengono costruite (ed i relativi env parsati)
+    # solo quando Settings viene effettivamente istanziato
+    app: AppSettings = Field(default_factory=AppSettings)
+    server: ServerSettings = Field(default_factory=ServerSettings)
+    rag: RAGSettings = Field(default_factory=RAGSettings)
+    llm: LLMSettings = Field(default_factory=LLMSettings)
+    storage: StorageSettings = Field(default_factory=StorageSettings)
+    security: SecuritySettings = Field(default_factory=SecuritySettings)
+    redis: RedisSettings = Field(default_factory=RedisSettings)
 
     # Campi aggiuntivi per supportare le variabili d'ambiente nel .env
     rag_config_file: Optional[str] = Field(default=None, env="RAG_CONFIG_FILE")
@@ -91,8 +99,14 @@ class Settings(BaseSettings):
         # extra = "allow"  # Permette campi extra se necessario
 
 
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Get the settings instance, parsing env vars and .env only once."""
+    return Settings()
+
+
 # Global settings instance
-settings = Settings()
+settings = get_settings()
 
 
 def get_project_root() -> Path:
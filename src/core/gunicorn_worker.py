@@ -0,0 +1,13 @@
+"""Gunicorn worker configuration."""
+
+from uvicorn.workers import UvicornWorker
+
+
+class UvloopUvicornWorker(UvicornWorker):
+    """UvicornWorker pinned to uvloop + httptools.
+
+    The stock worker ignores UVICORN_* environment variables;
+    CONFIG_KWARGS is the only supported hook for these options.
+    """
+
+    CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, "loop": "uvloop", "http": "httptools"}
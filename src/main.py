@@ -4,12 +4,15 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
+from src.api.dependencies import document_service_singleton, rag_service_singleton
 from src.api.v1.api import api_router
-from src.core.config import settings
+from src.core.config import ensure_directories, settings
+from src.services.query_batcher import QueryBatcher
 from src.utils.logging import get_logger, setup_logging
 
 logger = get_logger(__name__)
@@ -23,10 +26,24 @@ async def lifespan(app: FastAPI):
     setup_logging()
 
     # Ensure directories exist
-    from src.core.config import ensure_directories
-
     ensure_directories()
 
+    # Registro i singleton sullo stato dell'app, così le dependency diventano
+    # semplici letture di attributi
+    app.state.rag_service = rag_service_singleton
+    app.state.document_service = document_service_singleton
+
+    # Micro-batcher per le query concorrenti
+    app.state.query_batcher = QueryBatcher(rag_service_singleton)
+    app.state.query_batcher.start()
+
+    # Inizializzo e scaldo il servizio RAG subito, così la prima richiesta
+    # non paga né il caricamento del modello né il primo forward pass
+    try:
+        await rag_service_singleton.warmup()
+    except Exception as e:
+        logger.error(f"Failed to initialize RAG service at startup: {e}")
+
     logger.info("Local RAG Assistant started successfully")
 
     yield
@@ -34,12 +51,11 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down Local RAG Assistant...")
 
+    await app.state.query_batcher.stop()
+
     # STATELESS: pulisco i file temporanei alla chiusura
     try:
-        from src.api.dependencies import get_document_service
-
-        document_service = await get_document_service()
-        document_service.cleanup_temp_files()
+        app.state.document_service.cleanup_temp_files()
         logger.info("Temporary files cleaned up on shutdown")
     except Exception as e:
         logger.error(f"Failed to cleanup temporary files on shutdown: {e}")
@@ -51,6 +67,7 @@ app = FastAPI(
     version=settings.app.version,
     description="A powerful local RAG assistant for querying PDF documents",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs" if settings.app.debug else None,
     redoc_url=None,
 )
@@ -64,6 +81,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Comprimo le risposte JSON/HTML ripetitive (liste documenti, statistiche)
+app.add_middleware(GZipMiddleware, minimum_size=512)
+
 # Include API router
 app.include_router(api_router, prefix="/api/v1")
 
@@ -77,7 +97,7 @@ templates = Jinja2Templates(directory="src/templates")
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     """Serve the main application page."""
-    return templates.TemplateResponse("index.html", {"request": request})
+    return templates.TemplateResponse(request, "index.html")
 
 
 @app.get("/health")
@@ -95,4 +115,8 @@ if __name__ == "__main__":
         port=settings.server.port,
         reload=settings.app.debug,
         log_level="debug" if settings.app.debug else "info",
+        # uvloop + httptools (inclusi in uvicorn[standard]) riducono l'overhead
+        # per richiesta su endpoint piccoli e molto frequenti
+        loop="uvloop",
+        http="httptools",
     )
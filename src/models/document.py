@@ -58,19 +58,6 @@ class Document(DocumentBase):
         },
     }
 
-    def model_dump(self, **kwargs):
-        """Override model_dump to handle UUID and datetime serialization."""
-        data = super().model_dump(**kwargs)
-        # Convert UUID to string
-        if isinstance(data.get("id"), UUID):
-            data["id"] = str(data["id"])
-        # Convert datetime objects to ISO format strings
-        if isinstance(data.get("created_at"), datetime):
-            data["created_at"] = data["created_at"].isoformat()
-        if isinstance(data.get("updated_at"), datetime):
-            data["updated_at"] = data["updated_at"].isoformat()
-        return data
-
 
 class DocumentList(BaseModel):
     """Document list response."""
@@ -81,17 +68,3 @@ class DocumentList(BaseModel):
     per_page: int = Field(default=10, description="Documents per page")
 
     model_config = {"from_attributes": True}
-
-    def model_dump(self, **kwargs):
-        """Override model_dump to handle UUID and datetime serialization in documents."""
-        data = super().model_dump(**kwargs)
-        # Convert UUIDs and datetimes in documents list
-        if "documents" in data:
-            for doc in data["documents"]:
-                if isinstance(doc.get("id"), UUID):
-                    doc["id"] = str(doc["id"])
-                if isinstance(doc.get("created_at"), datetime):
-                    doc["created_at"] = doc["created_at"].isoformat()
-                if isinstance(doc.get("updated_at"), datetime):
-                    doc["updated_at"] = doc["updated_at"].isoformat()
-        return data
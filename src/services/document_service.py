@@ -1,21 +1,41 @@
 """Document management service."""
 
-import shutil
+import asyncio
+import os
 import tempfile
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
-from uuid import UUID, uuid4
+from typing import Dict, List, NamedTuple, Optional
+from uuid import uuid4
 
+import aiofiles
 from fastapi import UploadFile
 
 from src.core.config import settings
 from src.models.document import Document, DocumentCreate, DocumentList, DocumentUpdate
 from src.services.rag_service import RAGService
+from src.utils.async_cache import ttl_cache
 from src.utils.logging import get_logger
 
 logger = get_logger(__name__)
 
+# 1MB: con il default da 16KB una PDF da 50MB costerebbe ~3200 syscall in più
+_UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size limit."""
+
+    pass
+
+
+class DocumentRow(NamedTuple):
+    """Slim document projection for list rendering (no Pydantic overhead)."""
+
+    id: str
+    filename: str
+    file_size: int
+
 
 class DocumentService:
     """Service for document management."""
@@ -28,13 +48,26 @@ class DocumentService:
         # self.data_dir.mkdir(parents=True, exist_ok=True)
 
         # STATELESS: uso solo memoria temporanea per la sessione corrente
-        self._documents: Dict[UUID, Document] = {}
-        self._temp_files: Dict[UUID, Path] = {}
+        self._documents: Dict[str, Document] = {}
+        self._temp_files: Dict[str, Path] = {}
+
+        # Dimensione totale mantenuta incrementalmente: statistiche O(1)
+        self._total_size = 0
+
+        # Indice invertito token -> id documento e testo ricercabile per
+        # documento, ricostruiti pigramente dopo ogni mutazione
+        self._inverted: Dict[str, set] = {}
+        self._search_blobs: Dict[str, str] = {}
+        self._inverted_dirty = True
 
     async def upload_document(self, file: UploadFile, metadata: Optional[DocumentCreate] = None) -> Document:
         """Upload and process a document."""
+        # Calcolo il suffisso una sola volta e lo riuso per validazione e
+        # nome del file temporaneo
+        file_extension = Path(file.filename).suffix.lower() if file.filename else ""
+
         # Validate file
-        if not self._validate_file(file):
+        if not self._validate_file(file, file_extension):
             raise ValueError(f"Invalid file: {file.filename}")
 
         # Generate document ID
@@ -44,19 +77,18 @@ class DocumentService:
         temp_dir = Path(tempfile.gettempdir()) / "local_rag_temp"
         temp_dir.mkdir(exist_ok=True)
 
-        file_extension = Path(file.filename).suffix.lower()
         temp_file_path = temp_dir / f"{doc_id}{file_extension}"
 
         try:
-            # Save file to temp directory
-            with open(temp_file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-
-            # Get file info
-            file_size = temp_file_path.stat().st_size
-
-            # Create document record
-            document = Document(
+            # Save file to temp directory without a second full copy when the
+            # spool is already on disk; altrimenti streaming a chunk
+            file_size = await self._materialize_upload(file, temp_file_path)
+
+            # Create document record; i campi arrivano tutti da sorgenti
+            # controllate dal server, quindi model_construct salta la
+            # validazione Pydantic (i default vanno passati esplicitamente)
+            now = datetime.utcnow()
+            document = Document.model_construct(
                 id=doc_id,
                 filename=file.filename,
                 file_path=str(temp_file_path),
@@ -65,6 +97,11 @@ class DocumentService:
                 title=metadata.title if metadata else None,
                 description=metadata.description if metadata else None,
                 tags=metadata.tags if metadata else [],
+                pages=None,
+                created_at=now,
+                updated_at=now,
+                indexed=False,
+                chunk_count=None,
             )
 
             # Add to RAG index
@@ -75,30 +112,93 @@ class DocumentService:
                 document.chunk_count = 1  # This should be calculated from actual chunks
 
                 # STATELESS: salvo il documento solo in memoria per questa sessione
-                self._documents[doc_id] = document
-                self._temp_files[doc_id] = temp_file_path
+                # Chiavi stringa: hash più economico degli UUID e nessun
+                # round-trip di parsing al confine API
+                self._documents[str(doc_id)] = document
+                self._temp_files[str(doc_id)] = temp_file_path
+                self._total_size += document.file_size
+                self._invalidate_caches()
 
             logger.info(f"Document uploaded successfully: {document.filename}")
             return document
 
         except Exception as e:
-            # Clean up temp file if upload failed
+            # Clean up temp file if upload failed; unlink è I/O bloccante,
+            # quindi fuori dall'event loop
             if temp_file_path.exists():
-                temp_file_path.unlink()
+                await asyncio.to_thread(temp_file_path.unlink)
             logger.error(f"Failed to upload document {file.filename}: {e}")
             raise
 
-    def _validate_file(self, file: UploadFile) -> bool:
-        """Validate uploaded file."""
+    def _invalidate_caches(self) -> None:
+        """Drop cached listings, stats and search structures after a mutation."""
+        self._inverted_dirty = True
+        self.get_documents.cache_clear()
+        self.get_documents_lite.cache_clear()
+        self.get_document_stats.cache_clear()
+        self.rag_service.get_index_stats.cache_clear()
+
+    async def _materialize_upload(self, file: UploadFile, temp_file_path: Path) -> int:
+        """Materialize the upload at ``temp_file_path``, avoiding a second copy.
+
+        Large uploads have already been spooled to a real temp file by
+        Starlette: in that case an hard link makes the file appear at the
+        destination senza ricopiarne i byte. In-memory spools (upload
+        piccoli) and filesystems without link support fall back to the
+        chunked streaming copy.
+        """
+        spool = file.file
+        backing = getattr(spool, "_file", None)
+        name = getattr(backing, "name", None)
+        if getattr(spool, "_rolled", False) and name is not None:
+            await asyncio.to_thread(backing.flush)
+            size = (await asyncio.to_thread(os.stat, name)).st_size
+            if size > settings.security.max_upload_size:
+                raise UploadTooLargeError(
+                    f"File {file.filename} exceeds maximum upload size of {settings.security.max_upload_size} bytes"
+                )
+            # Su Linux il file temporaneo è anonimo (O_TMPFILE) e name è il
+            # file descriptor: si linka attraverso /proc/self/fd
+            link_src = name if isinstance(name, str) else f"/proc/self/fd/{name}"
+            try:
+                await asyncio.to_thread(os.link, link_src, temp_file_path)
+                return size
+            except OSError:
+                # Filesystem diverso o senza hard link: si ricade sulla copia
+                pass
+        return await self._save_upload(file, temp_file_path)
+
+    async def _save_upload(self, file: UploadFile, temp_file_path: Path) -> int:
+        """Stream an upload to disk in chunks, enforcing the size limit incrementally."""
+        max_size = settings.security.max_upload_size
+        bytes_written = 0
+
+        async with aiofiles.open(temp_file_path, "wb") as buffer:
+            while chunk := await file.read(_UPLOAD_CHUNK_SIZE):
+                bytes_written += len(chunk)
+                if bytes_written > max_size:
+                    # Abort as soon as the limit is exceeded instead of
+                    # buffering the whole file first
+                    raise UploadTooLargeError(f"File {file.filename} exceeds maximum upload size of {max_size} bytes")
+                await buffer.write(chunk)
+
+        return bytes_written
+
+    def _validate_file(self, file: UploadFile, file_extension: str) -> bool:
+        """Validate uploaded file.
+
+        Raises :class:`UploadTooLargeError` for oversize uploads so the
+        endpoint can answer 413 instead of a generic 400.
+        """
         # Check file size
         if file.size and file.size > settings.security.max_upload_size:
-            return False
+            raise UploadTooLargeError(
+                f"File {file.filename} exceeds maximum upload size of {settings.security.max_upload_size} bytes"
+            )
 
-        # Check file extension
-        if file.filename:
-            file_extension = Path(file.filename).suffix.lower()
-            if file_extension not in settings.security.allowed_extensions:
-                return False
+        # Check file extension (frozenset: membership O(1))
+        if file.filename and file_extension not in settings.security.allowed_extensions_set:
+            return False
 
         # Check content type
         if file.content_type and not file.content_type.startswith("application/pdf"):
@@ -106,25 +206,58 @@ class DocumentService:
 
         return True
 
-    async def get_document(self, document_id: UUID) -> Optional[Document]:
+    async def get_document(self, document_id: str) -> Optional[Document]:
         """Get document by ID."""
         # STATELESS: restituisco solo i documenti caricati in questa sessione
         return self._documents.get(document_id)
 
+    def _rebuild_inverted_index(self) -> None:
+        """Rebuild the token -> document id posting lists and search blobs."""
+        inverted: Dict[str, set] = {}
+        blobs: Dict[str, str] = {}
+        for doc_id, doc in self._documents.items():
+            # Newline come separatore: evita match spuri a cavallo dei campi
+            text = "\n".join(filter(None, (doc.filename, doc.title, doc.description))).lower()
+            blobs[doc_id] = text
+            for token in text.split():
+                inverted.setdefault(token, set()).add(doc_id)
+        self._inverted = inverted
+        self._search_blobs = blobs
+        self._inverted_dirty = False
+
+    def _filter_documents(self, search: Optional[str]) -> List[Document]:
+        """Get the session documents, optionally filtered by search text."""
+        # STATELESS: restituisco solo i documenti caricati in questa sessione
+        if not search:
+            return list(self._documents.values())
+
+        if self._inverted_dirty:
+            self._rebuild_inverted_index()
+
+        needle = search.lower()
+
+        if " " not in needle:
+            # Prefiltro con l'indice invertito: scandisco il vocabolario (piccolo)
+            # invece dei campi di ogni documento, poi verifico solo i candidati
+            candidate_ids: set = set()
+            for token, doc_ids in self._inverted.items():
+                if needle in token:
+                    candidate_ids.update(doc_ids)
+            items = [(doc_id, doc) for doc_id, doc in self._documents.items() if doc_id in candidate_ids]
+        else:
+            # Le ricerche con spazi possono attraversare i confini dei token:
+            # scansione lineare per mantenere la semantica substring
+            items = list(self._documents.items())
+
+        # Verifica finale: un solo scan substring sul blob precomputato per
+        # documento invece di tre campi lowercased ad ogni chiamata
+        blobs = self._search_blobs
+        return [doc for doc_id, doc in items if needle in blobs.get(doc_id, "")]
+
+    @ttl_cache(maxsize=128, ttl=30)
     async def get_documents(self, skip: int = 0, limit: int = 10, search: Optional[str] = None) -> DocumentList:
         """Get list of documents."""
-        # STATELESS: restituisco solo i documenti caricati in questa sessione
-        documents = list(self._documents.values())
-
-        # Apply search filter
-        if search:
-            documents = [
-                doc
-                for doc in documents
-                if search.lower() in doc.filename.lower()
-                or (doc.title and search.lower() in doc.title.lower())
-                or (doc.description and search.lower() in doc.description.lower())
-            ]
+        documents = self._filter_documents(search)
 
         # Apply pagination
         total = len(documents)
@@ -132,7 +265,22 @@ class DocumentService:
 
         return DocumentList(documents=documents, total=total, page=skip // limit + 1, per_page=limit)
 
-    async def update_document(self, document_id: UUID, update: DocumentUpdate) -> Optional[Document]:
+    @ttl_cache(maxsize=128, ttl=30)
+    async def get_documents_lite(
+        self, skip: int = 0, limit: int = 10, search: Optional[str] = None
+    ) -> List[DocumentRow]:
+        """Get a slim (id, filename, file_size) projection of the document list.
+
+        Avoids building DocumentList/Document Pydantic payloads when the
+        caller only renders a couple of fields (HTMX list polling).
+        """
+        documents = self._filter_documents(search)
+        return [
+            DocumentRow(id=str(doc.id), filename=doc.filename, file_size=doc.file_size)
+            for doc in documents[skip : skip + limit]
+        ]
+
+    async def update_document(self, document_id: str, update: DocumentUpdate) -> Optional[Document]:
         """Update document metadata."""
         # STATELESS: aggiorno solo i documenti in memoria
         document = self._documents.get(document_id)
@@ -146,10 +294,11 @@ class DocumentService:
                 document.tags = update.tags
 
             document.updated_at = datetime.utcnow()
+            self._invalidate_caches()
 
         return document
 
-    async def delete_document(self, document_id: UUID) -> bool:
+    async def delete_document(self, document_id: str) -> bool:
         """Delete document."""
         try:
             document = self._documents.get(document_id)
@@ -157,16 +306,18 @@ class DocumentService:
                 return False
 
             # Remove from RAG index
-            await self.rag_service.remove_document(str(document_id))
+            await self.rag_service.remove_document(document_id)
 
             # STATELESS: rimuovo dalla memoria e cancello il file temporaneo
             del self._documents[document_id]
+            self._total_size -= document.file_size
 
             temp_file_path = self._temp_files.get(document_id)
             if temp_file_path and temp_file_path.exists():
                 temp_file_path.unlink()
                 del self._temp_files[document_id]
 
+            self._invalidate_caches()
             logger.info(f"Document deleted: {document.filename}")
             return True
 
@@ -174,11 +325,13 @@ class DocumentService:
             logger.error(f"Failed to delete document {document_id}: {e}")
             return False
 
+    @ttl_cache(maxsize=8, ttl=30)
     async def get_document_stats(self) -> dict:
         """Get document statistics."""
         try:
-            # STATELESS: calcolo le statistiche solo sui documenti in memoria
-            total_size = sum(doc.file_size for doc in self._documents.values())
+            # STATELESS: statistiche solo sui documenti in memoria; la
+            # dimensione totale è mantenuta incrementalmente dalle mutazioni
+            total_size = self._total_size
 
             return {
                 "total_documents": len(self._documents),
@@ -202,6 +355,7 @@ class DocumentService:
 
         # STATELESS: pulisco tutti i documenti dalla memoria
         self._documents.clear()
+        self._total_size = 0
 
         # Cancello tutti i file temporanei
         for temp_file_path in self._temp_files.values():
@@ -215,6 +369,7 @@ class DocumentService:
 
         # Reset RAG index
         self.rag_service.reset_index()
+        self._invalidate_caches()
 
         logger.info(f"Reset completed: {deleted_count} documents removed")
         return deleted_count
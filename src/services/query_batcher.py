@@ -0,0 +1,78 @@
+"""Micro-batching for query requests."""
+
+import asyncio
+from typing import Optional, Tuple
+
+from src.models.query import QueryRequest, QueryResponse
+from src.services.rag_service import RAGService
+from src.utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class QueryBatcher:
+    """Coalesce concurrent queries into batched RAG calls.
+
+    Requests arriving within a small window are drained from an
+    ``asyncio.Queue`` and handed to ``RAGService.query_batch`` as one
+    batch, so their embeddings are computed in a single forward pass.
+    """
+
+    def __init__(self, rag_service: RAGService, max_batch: int = 16, window: float = 0.010):
+        """Initialize the batcher."""
+        self.rag_service = rag_service
+        self.max_batch = max_batch
+        self.window = window
+        self._queue: "asyncio.Queue[Tuple[QueryRequest, asyncio.Future]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the background batching task."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info("Query batcher started")
+
+    async def stop(self) -> None:
+        """Stop the background batching task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("Query batcher stopped")
+
+    async def submit(self, request: QueryRequest) -> QueryResponse:
+        """Submit a query and wait for its batched response."""
+        if self._task is None:
+            # Batcher non attivo (es. lifespan non avviato): chiamata diretta
+            return await self.rag_service.query(request)
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((request, future))
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+
+            # Drain whatever else arrives within the batching window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=self.window))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                responses = await self.rag_service.query_batch([request for request, _ in batch])
+            except Exception as e:
+                logger.error(f"Query batch failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
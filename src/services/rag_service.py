@@ -1,82 +1,100 @@
 """RAG (Retrieval-Augmented Generation) service."""
 
 import asyncio
+import functools
+import os
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional
 
+import faiss
+import torch
+from llama_index.core import Document as LlamaDocument
+from llama_index.core import Settings as LlamaSettings
 from llama_index.core import VectorStoreIndex
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    CompletionResponse,
+    LLMMetadata,
+    MessageRole,
+)
 from llama_index.core.embeddings import BaseEmbedding
 from llama_index.core.llms import LLM
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core.readers import SimpleDirectoryReader
+from llama_index.core.schema import QueryBundle
 from llama_index.core.storage.storage_context import StorageContext
-from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.vector_stores.faiss import FaissVectorStore
+from pypdf import PdfReader
 from sentence_transformers import SentenceTransformer
 
 from src.core.config import settings
 from src.models.document import Document
 from src.models.query import QueryRequest, QueryResponse, SourceDocument
+from src.utils.async_cache import ttl_cache
 from src.utils.logging import get_logger
 
 logger = get_logger(__name__)
 
+# Numero massimo di embedding di query tenuti in cache
+_QUERY_CACHE_MAX = 512
+
+# Pagine accumulate prima di ogni insert nell'indice durante l'ingestione
+_INGEST_BATCH_PAGES = 32
+
+# Metadata del DummyLLM: immutabili, costruiti una sola volta
+_DUMMY_LLM_METADATA = LLMMetadata(
+    context_window=3900,
+    num_output=256,
+    is_chat_model=False,
+    is_function_calling_model=False,
+    model_name="dummy-llm",
+    system_role=MessageRole.SYSTEM,
+)
+
+
+def _detect_device() -> str:
+    """Pick the best available torch device for the embedding model."""
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
 
 class DummyLLM(LLM):
     """Dummy LLM that does nothing to avoid OpenAI loading."""
 
     @property
     def metadata(self):
-        from llama_index.core.base.llms.types import MessageRole
-        from llama_index.core.llms.llm import LLMMetadata
-
-        return LLMMetadata(
-            context_window=3900,
-            num_output=256,
-            is_chat_model=False,
-            is_function_calling_model=False,
-            model_name="dummy-llm",
-            system_role=MessageRole.SYSTEM,
-        )
+        return _DUMMY_LLM_METADATA
 
     def complete(self, prompt: str, formatted: bool = False, **kwargs):
-        from llama_index.core.base.llms.types import CompletionResponse
-
         return CompletionResponse(text="Dummy response")
 
     def stream_complete(self, prompt: str, formatted: bool = False, **kwargs):
-        from llama_index.core.base.llms.types import CompletionResponse
-
         yield CompletionResponse(text="Dummy response")
 
     def chat(self, messages, **kwargs):
-        from llama_index.core.base.llms.types import ChatMessage, ChatResponse
-
         return ChatResponse(message=ChatMessage(content="Dummy response"))
 
     def stream_chat(self, messages, **kwargs):
-        from llama_index.core.base.llms.types import ChatMessage, ChatResponse
-
         yield ChatResponse(message=ChatMessage(content="Dummy response"))
 
     async def achat(self, messages, **kwargs):
-        from llama_index.core.base.llms.types import ChatMessage, ChatResponse
-
         return ChatResponse(message=ChatMessage(content="Dummy response"))
 
     async def acomplete(self, prompt: str, formatted: bool = False, **kwargs):
-        from llama_index.core.base.llms.types import CompletionResponse
-
         return CompletionResponse(text="Dummy response")
 
     async def astream_chat(self, messages, **kwargs):
-        from llama_index.core.base.llms.types import ChatMessage, ChatResponse
-
         yield ChatResponse(message=ChatMessage(content="Dummy response"))
 
     async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs):
-        from llama_index.core.base.llms.types import CompletionResponse
-
         yield CompletionResponse(text="Dummy response")
 
 
@@ -87,19 +105,84 @@ class SentenceTransformerEmbedding(BaseEmbedding):
         """Initialize with model name."""
         super().__init__()
         # Use a different approach to avoid Pydantic field validation
-        object.__setattr__(self, "_model", SentenceTransformer(model_name))
+        object.__setattr__(self, "_model", SentenceTransformer(model_name, device=_detect_device()))
+        # LRU cache degli embedding di query: le ripetizioni (retry, polling)
+        # evitano un forward pass completo del transformer
+        object.__setattr__(self, "_query_cache", OrderedDict())
+        # threading.Lock: il retriever gira in thread worker, non sull'event loop
+        object.__setattr__(self, "_query_cache_lock", threading.Lock())
 
     def _get_query_embedding(self, query: str) -> List[float]:
-        """Get embedding for query."""
-        return self._model.encode(query).tolist()
+        """Get embedding for query, memoized by normalized query text."""
+        key = query.strip().lower()
+        with self._query_cache_lock:
+            cached = self._query_cache.get(key)
+            if cached is not None:
+                self._query_cache.move_to_end(key)
+                return cached
+
+        embedding = self._model.encode(
+            query, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False
+        ).tolist()
+
+        with self._query_cache_lock:
+            self._query_cache[key] = embedding
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > _QUERY_CACHE_MAX:
+                self._query_cache.popitem(last=False)
+        return embedding
+
+    def _get_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        """Get embeddings for multiple queries, consulting the query cache.
+
+        Cache hits skip the forward pass; misses are encoded in one batch
+        and written back, so batched and single-query paths return
+        identical embeddings for the same query.
+        """
+        keys = [query.strip().lower() for query in queries]
+        results: List[Optional[List[float]]] = [None] * len(queries)
+        with self._query_cache_lock:
+            for i, key in enumerate(keys):
+                cached = self._query_cache.get(key)
+                if cached is not None:
+                    self._query_cache.move_to_end(key)
+                    results[i] = cached
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            encoded = self._model.encode(
+                [queries[i] for i in missing],
+                batch_size=64,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            ).tolist()
+            with self._query_cache_lock:
+                for i, embedding in zip(missing, encoded):
+                    results[i] = embedding
+                    self._query_cache[keys[i]] = embedding
+                    self._query_cache.move_to_end(keys[i])
+                while len(self._query_cache) > _QUERY_CACHE_MAX:
+                    self._query_cache.popitem(last=False)
+        return results
 
     def _get_text_embedding(self, text: str) -> List[float]:
         """Get embedding for text."""
-        return self._model.encode(text).tolist()
+        embedding = self._model.encode(text, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
+        return embedding.tolist()
 
     def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Get embeddings for multiple texts."""
-        return self._model.encode(texts).tolist()
+        """Get embeddings for multiple texts in large batches."""
+        # NIENTE quantizzazione fp16 qui: l'arrotondamento denormalizza i
+        # vettori (self-IP > 1.0) e FAISS li impacchetta comunque in float32
+        embeddings = self._model.encode(
+            texts,
+            batch_size=64,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return embeddings.tolist()
 
     async def _aget_query_embedding(self, query: str) -> List[float]:
         """Get embedding for query (async version)."""
@@ -113,6 +196,10 @@ class SentenceTransformerEmbedding(BaseEmbedding):
         """Get embeddings for multiple texts (async version)."""
         return self._get_text_embeddings(texts)
 
+    def embedding_dimension(self) -> int:
+        """Dimensionality of the embedding vectors."""
+        return self._model.get_sentence_embedding_dimension()
+
 
 class RAGService:
     """RAG service for document processing and querying."""
@@ -121,19 +208,70 @@ class RAGService:
         """Initialize RAG service."""
         self.index: Optional[VectorStoreIndex] = None
         self.embedding_model: Optional[SentenceTransformerEmbedding] = None
+        self._storage_context: Optional[StorageContext] = None
         self._initialized = False
+        self._init_lock = asyncio.Lock()
+        # Pool dedicato a embedding/retrieval: il pool di default di
+        # asyncio.to_thread è condiviso con tutto il resto (upload, I/O) e
+        # sotto carico concorrente diventa un collo di bottiglia
+        self._exec = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="rag")
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Run blocking embedding/retrieval work on the dedicated executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._exec, functools.partial(func, *args, **kwargs))
+
+    @property
+    def initialized(self) -> bool:
+        """Whether the service has been initialized."""
+        return self._initialized
 
     async def initialize(self):
         """Initialize the RAG service."""
         if self._initialized:
             return
-        logger.info("Initializing RAG service...")
-        # Initialize embedding model
-        self.embedding_model = SentenceTransformerEmbedding(settings.rag.embedding_model)
-        # NON caricare nessun indice da disco: stateless
-        self.index = None
-        self._initialized = True
-        logger.info("RAG service initialized successfully")
+        async with self._init_lock:
+            if self._initialized:
+                return
+            logger.info("Initializing RAG service...")
+            # Initialize embedding model; loading weights is blocking, so keep
+            # it off the event loop
+            self.embedding_model = await self._run_blocking(SentenceTransformerEmbedding, settings.rag.embedding_model)
+            # Configurazione globale llama_index: LLM, embedding e splitter
+            # costruiti una sola volta invece che ad ogni add_document
+            LlamaSettings.llm = DummyLLM()
+            LlamaSettings.embed_model = self.embedding_model
+            LlamaSettings.node_parser = SentenceSplitter(
+                chunk_size=settings.rag.chunk_size,
+                chunk_overlap=settings.rag.chunk_overlap,
+            )
+            self._storage_context = StorageContext.from_defaults(vector_store=self._create_vector_store())
+            # NON caricare nessun indice da disco: stateless
+            self.index = None
+            self._initialized = True
+            logger.info("RAG service initialized successfully")
+
+    async def warmup(self):
+        """Run a throwaway encode so the first real query pays no cold-start cost.
+
+        The first `encode` after loading the weights also triggers torch's
+        arena allocations and kernel selection; doing it at startup keeps
+        that latency out of the request path.
+        """
+        await self.initialize()
+        await self._run_blocking(
+            self.embedding_model._model.encode,
+            ["warmup"] * 4,
+            show_progress_bar=False,
+        )
+        logger.info("Embedding model warmed up")
+
+    def _create_vector_store(self) -> FaissVectorStore:
+        """Build an HNSW-backed FAISS vector store for sub-linear top-k."""
+        faiss_index = faiss.IndexHNSWFlat(self.embedding_model.embedding_dimension(), 32, faiss.METRIC_INNER_PRODUCT)
+        faiss_index.hnsw.efConstruction = 200
+        faiss_index.hnsw.efSearch = 64
+        return FaissVectorStore(faiss_index=faiss_index)
 
     async def _save_index(self):
         """Stateless: non salva nulla su disco."""
@@ -144,53 +282,73 @@ class RAGService:
         return
 
     async def add_document(self, document: Document) -> bool:
-        """Add document to the index."""
+        """Add document to the index, streaming pages in mini-batches."""
         await self.initialize()
         try:
-            # Read document
-            documents = await self._read_document(document.file_path)
-            logger.info(f"[DEBUG] Documenti estratti: {documents}")
-            if not documents:
+            # Parsing + embedding sono bloccanti: tutta l'ingestione gira sul
+            # pool dedicato; le pagine vengono lette pigramente e inserite a
+            # lotti, quindi la memoria di picco non dipende dalla dimensione
+            # del PDF
+            inserted = await self._run_blocking(self._ingest_streaming, document.file_path)
+            if not inserted:
                 logger.error(f"No content extracted from {document.file_path}")
                 return False
-            # Crea il node_parser
-            node_parser = SentenceSplitter(
-                chunk_size=settings.rag.chunk_size,
-                chunk_overlap=settings.rag.chunk_overlap,
-            )
-            # SEMPRE ricrea l'indice da zero (stateless)
-            self.index = VectorStoreIndex.from_documents(
-                documents,
-                embed_model=self.embedding_model,
-                node_parser=node_parser,
-                storage_context=StorageContext.from_defaults(vector_store=SimpleVectorStore()),
-                llm=DummyLLM(),  # <--- Usa DummyLLM invece di None per evitare OpenAI
-            )
-            logger.info(f"[DEBUG] Indice ricreato: {self.index}")
             logger.info(f"[DEBUG] Numero documenti nell'indice: {len(self.index.docstore.docs) if self.index else 0}")
             # Save index
             await self._save_index()
-            logger.info(f"Document {document.filename} added to index successfully")
+            logger.info(f"Document {document.filename} added to index successfully ({inserted} pages)")
             return True
         except Exception as e:
             logger.error(f"Failed to add document {document.filename}: {e}")
             return False
 
-    async def _read_document(self, file_path: str) -> List:
-        """Read document content."""
-        try:
-            # Use SimpleDirectoryReader for PDF files
-            loader = SimpleDirectoryReader(input_files=[file_path], filename_as_id=True)
-
-            documents = loader.load_data()
-            return documents
+    def _iter_pages(self, file_path: str):
+        """Yield one llama Document per page without materializing the file."""
+        if file_path.lower().endswith(".pdf"):
+            reader = PdfReader(file_path)
+            file_name = Path(file_path).name
+            for i, page in enumerate(reader.pages):
+                text = page.extract_text() or ""
+                if not text.strip():
+                    continue
+                yield LlamaDocument(text=text, metadata={"file_name": file_name, "page_label": str(i + 1)})
+        else:
+            # Formati non PDF: fallback sul reader generico (lista in memoria)
+            yield from SimpleDirectoryReader(input_files=[file_path], filename_as_id=True).load_data()
+
+    def _ingest_streaming(self, file_path: str) -> int:
+        """Parse pages lazily and insert them into the index in mini-batches.
+
+        Runs on the dedicated executor: each batch is split and embedded
+        while the next pages are still being parsed off a bounded buffer.
+        """
+        inserted = 0
+        batch: List[LlamaDocument] = []
+        for page_doc in self._iter_pages(file_path):
+            batch.append(page_doc)
+            if len(batch) >= _INGEST_BATCH_PAGES:
+                self._insert_batch(batch)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            self._insert_batch(batch)
+            inserted += len(batch)
+        return inserted
+
+    def _insert_batch(self, batch: List[LlamaDocument]) -> None:
+        """Split a batch of page documents into nodes and index them."""
+        nodes = LlamaSettings.node_parser.get_nodes_from_documents(batch)
+        if self.index is None:
+            self.index = VectorStoreIndex(nodes=nodes, storage_context=self._storage_context)
+        else:
+            self.index.insert_nodes(nodes)
 
-        except Exception as e:
-            logger.error(f"Failed to read document {file_path}: {e}")
-            return []
+    async def query(self, request: QueryRequest, query_embedding: Optional[List[float]] = None) -> QueryResponse:
+        """Process a query and return response.
 
-    async def query(self, request: QueryRequest) -> QueryResponse:
-        """Process a query and return response."""
+        When ``query_embedding`` is provided (batched path) the retriever
+        reuses it instead of embedding the query again.
+        """
         await self.initialize()
         start_time = time.time()
         try:
@@ -210,32 +368,36 @@ class RAGService:
             retriever = self.index.as_retriever(similarity_top_k=request.top_k)
 
             # Execute retrieval
-            nodes = await asyncio.to_thread(retriever.retrieve, request.query)
-
-            # Extract sources and build response text
-            sources = []
-            response_text = ""
-
-            if nodes:
-                for i, node in enumerate(nodes):
-                    source = SourceDocument(
-                        document_id=node.node_id,
-                        document_title=node.metadata.get("file_name", "Unknown"),
-                        chunk_text=node.text,
-                        similarity_score=node.score if hasattr(node, "score") else 0.0,
-                        page_number=node.metadata.get("page_label"),
-                        chunk_index=node.metadata.get("chunk_index", 0),
-                    )
-                    sources.append(source.dict())
-
-                    # Build response text from source documents
-                    if i == 0:
-                        response_text = f"Basandomi sui documenti caricati, ecco cosa ho trovato:\n\n"
-                    response_text += (
-                        f"**Fonte {i+1} (pagina {node.metadata.get('page_label', 'N/A')}):**\n{node.text}\n\n"
-                    )
-
-            if not sources:
+            if query_embedding is not None:
+                bundle = QueryBundle(query_str=request.query, embedding=query_embedding)
+                nodes = await self._run_blocking(retriever.retrieve, bundle)
+            else:
+                nodes = await self._run_blocking(retriever.retrieve, request.query)
+
+            # Extract sources and build response text; una lista di frammenti
+            # con join finale invece di concatenazioni ripetute (O(n) vs O(n²))
+            sources = [
+                SourceDocument(
+                    document_id=node.node_id,
+                    document_title=node.metadata.get("file_name", "Unknown"),
+                    chunk_text=node.text,
+                    # Clamp al dominio [0, 1] del modello: i punteggi grezzi del
+                    # backend possono sforare per rumore float o cambi di metrica
+                    similarity_score=min(1.0, max(0.0, getattr(node, "score", None) or 0.0)),
+                    page_number=node.metadata.get("page_label"),
+                    chunk_index=node.metadata.get("chunk_index", 0),
+                ).model_dump()
+                for node in nodes
+            ]
+
+            if sources:
+                parts = ["Basandomi sui documenti caricati, ecco cosa ho trovato:\n\n"]
+                parts.extend(
+                    f"**Fonte {i+1} (pagina {node.metadata.get('page_label', 'N/A')}):**\n{node.text}\n\n"
+                    for i, node in enumerate(nodes)
+                )
+                response_text = "".join(parts)
+            else:
                 response_text = (
                     "Non ho trovato informazioni rilevanti nei documenti caricati per rispondere alla tua domanda."
                 )
@@ -261,6 +423,25 @@ class RAGService:
                 processing_time=time.time() - start_time,
             )
 
+    async def query_batch(self, requests: List[QueryRequest]) -> List[QueryResponse]:
+        """Process a batch of queries, embedding them in a single forward pass."""
+        if len(requests) == 1:
+            return [await self.query(requests[0])]
+
+        await self.initialize()
+        if self.index is None:
+            return [await self.query(request) for request in requests]
+
+        # Una sola encode per le query del batch non già in cache
+        embeddings = await self._run_blocking(
+            self.embedding_model._get_query_embeddings, [request.query for request in requests]
+        )
+        return list(
+            await asyncio.gather(
+                *(self.query(request, query_embedding=embedding) for request, embedding in zip(requests, embeddings))
+            )
+        )
+
     async def remove_document(self, document_id: str) -> bool:
         """Remove document from index."""
         # Note: This is a simplified implementation
@@ -268,6 +449,7 @@ class RAGService:
         logger.warning("Document removal not fully implemented")
         return True
 
+    @ttl_cache(maxsize=8, ttl=30)
     async def get_index_stats(self) -> dict:
         """Get index statistics."""
         await self.initialize()
@@ -290,11 +472,18 @@ class RAGService:
             return {"total_documents": 0, "total_chunks": 0, "index_size_mb": 0}
 
     def reset_index(self):
-        """Resetta completamente lo stato in memoria."""
+        """Drop the in-memory index, keeping the embedding model loaded.
+
+        Reloading the SentenceTransformer costs hundreds of ms and hundreds
+        of MB of tensor allocations; a session reset only needs the vectors
+        gone, not the model.
+        """
         self.index = None
-        self.embedding_model = None
-        self._initialized = False
-        logger.info("[DEBUG] Stato RAGService azzerato: index, embedding_model, _initialized")
+        if self._initialized:
+            # Vector store nuovo: quello FAISS trattiene i vettori eliminati
+            self._storage_context = StorageContext.from_defaults(vector_store=self._create_vector_store())
+        self.get_index_stats.cache_clear()
+        logger.info("[DEBUG] Indice azzerato; modello di embedding mantenuto in memoria")
 
 
 # Singleton da usare per tutte le dipendenze
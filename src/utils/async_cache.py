@@ -0,0 +1,57 @@
+"""Small TTL cache for async functions."""
+
+import asyncio
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Tuple
+
+
+def ttl_cache(maxsize: int = 128, ttl: float = 30.0) -> Callable:
+    """Cache results of an async function for a short time.
+
+    Results are keyed by the call arguments and expire after ``ttl`` seconds.
+    Concurrent calls for the same key are coalesced behind a per-key
+    ``asyncio.Lock`` so the wrapped function runs at most once per miss.
+    The wrapper exposes ``cache_clear()`` for explicit invalidation.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        cache: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        locks: Dict[Tuple, asyncio.Lock] = {}
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+
+            entry = cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                cache.move_to_end(key)
+                return entry[1]
+
+            lock = locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                # Another waiter may have populated the cache while we
+                # were queued on the lock
+                entry = cache.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+
+                result = await func(*args, **kwargs)
+
+                cache[key] = (time.monotonic() + ttl, result)
+                cache.move_to_end(key)
+                while len(cache) > maxsize:
+                    evicted, _ = cache.popitem(last=False)
+                    locks.pop(evicted, None)
+
+                return result
+
+        def cache_clear() -> None:
+            cache.clear()
+            locks.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
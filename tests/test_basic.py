@@ -7,32 +7,36 @@ from src.core.config import settings
 from src.main import app
 
 
+@pytest.fixture(scope="module")
+def client():
+    """Shared TestClient: lifespan startup runs once for the whole module."""
+    with TestClient(app) as c:
+        yield c
+
+
 def test_app_import():
     """Test that the app can be imported."""
     assert app is not None
     assert app.title == "Local RAG Assistant"
 
 
-def test_health_endpoint():
+def test_health_endpoint(client):
     """Test health check endpoint."""
-    client = TestClient(app)
     response = client.get("/health")
     assert response.status_code == 200
     assert response.json()["status"] == "healthy"
 
 
-def test_api_docs_available():
+def test_api_docs_available(client):
     """Test that API docs are available in debug mode."""
     if not settings.app.debug:
         pytest.skip("Docs not enabled in production mode")
-    client = TestClient(app)
     response = client.get("/docs")
     assert response.status_code == 200
 
 
-def test_root_endpoint():
+def test_root_endpoint(client):
     """Test root endpoint serves HTML."""
-    client = TestClient(app)
     response = client.get("/")
     assert response.status_code == 200
     assert "text/html" in response.headers["content-type"]